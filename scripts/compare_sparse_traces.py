@@ -4,72 +4,119 @@ Compare sparse traces from CEmu and our emulator.
 Both should log at the same cycle intervals (every 100K cycles).
 """
 
+import mmap
+import os
 import re
 import sys
+from itertools import compress
+from operator import itemgetter, ne
+
+# Compiled once; parse_snapshot runs for every line of multi-GB traces.
+# The register block has a fixed layout; the trailing state fields are matched
+# in a single finditer pass since the two emulators don't order them the same.
+_SNAP_RE = re.compile(
+    r'\[snapshot\] cycle=(?P<cycle>\d+) PC=(?P<pc>[0-9A-F]+) SP=(?P<sp>[0-9A-F]+) '
+    r'AF=(?P<af>[0-9A-F]+) BC=(?P<bc>[0-9A-F]+) DE=(?P<de>[0-9A-F]+) HL=(?P<hl>[0-9A-F]+)'
+)
+_STATE_RE = re.compile(
+    r'INTR\[stat=(?P<intr_stat>[0-9A-F]+) en=(?P<intr_en>[0-9A-F]+)'
+    r'|CTRL\[pwr=(?P<pwr>[0-9A-F]+) spd=(?P<spd>[0-9A-F]+)'
+    r'|HALT=(?P<halt>\d+|true|false)'
+    r'|IFF1=(?P<iff1>\d+|true|false)'
+)
 
 def parse_snapshot(line):
     """Parse a [snapshot] line and return a dict of values."""
-    match = re.search(r'\[snapshot\] cycle=(\d+) PC=([0-9A-F]+) SP=([0-9A-F]+) AF=([0-9A-F]+) BC=([0-9A-F]+) DE=([0-9A-F]+) HL=([0-9A-F]+)', line)
+    match = _SNAP_RE.search(line)
     if not match:
         return None
 
-    # Also parse interrupt and control state
-    intr_match = re.search(r'INTR\[stat=([0-9A-F]+) en=([0-9A-F]+)', line)
-    ctrl_match = re.search(r'CTRL\[pwr=([0-9A-F]+) spd=([0-9A-F]+)', line)
-    halt_match = re.search(r'HALT=(\d+|true|false)', line)
-    iff_match = re.search(r'IFF1=(\d+|true|false)', line)
-
-    halt_val = halt_match.group(1) if halt_match else "0"
+    # Also parse interrupt and control state, keyed by the last group each
+    # alternative sets (first occurrence of each wins)
+    state = {}
+    for m in _STATE_RE.finditer(line, match.end()):
+        state.setdefault(m.lastgroup, m)
+    intr_match = state.get('intr_en')
+    ctrl_match = state.get('spd')
+    halt_match = state.get('halt')
+    iff_match = state.get('iff1')
+
+    halt_val = halt_match['halt'] if halt_match else "0"
     halt = halt_val in ("1", "true")
 
-    iff_val = iff_match.group(1) if iff_match else "0"
+    iff_val = iff_match['iff1'] if iff_match else "0"
     iff1 = iff_val in ("1", "true")
 
+    # Hex fields are kept as the raw strings: they are only compared for
+    # equality, and compare_snapshots converts the few that differ
     return {
-        'cycle': int(match.group(1)),
-        'pc': int(match.group(2), 16),
-        'sp': int(match.group(3), 16),
-        'af': int(match.group(4), 16),
-        'bc': int(match.group(5), 16),
-        'de': int(match.group(6), 16),
-        'hl': int(match.group(7), 16),
-        'intr_stat': int(intr_match.group(1), 16) if intr_match else 0,
-        'intr_en': int(intr_match.group(2), 16) if intr_match else 0,
+        'cycle': int(match['cycle']),
+        'pc': match['pc'],
+        'sp': match['sp'],
+        'af': match['af'],
+        'bc': match['bc'],
+        'de': match['de'],
+        'hl': match['hl'],
+        'intr_stat': intr_match['intr_stat'] if intr_match else '0',
+        'intr_en': intr_match['intr_en'] if intr_match else '0',
         'halt': halt,
         'iff1': iff1,
-        'pwr': int(ctrl_match.group(1), 16) if ctrl_match else 0,
-        'spd': int(ctrl_match.group(2), 16) if ctrl_match else 0,
+        'pwr': ctrl_match['pwr'] if ctrl_match else '0',
+        'spd': ctrl_match['spd'] if ctrl_match else '0',
         'line': line.strip()
     }
 
+def _next_snapshot(mm, pos):
+    """Return the offset of the next [snapshot] line start after pos, or -1."""
+    idx = mm.find(b'\n[snapshot]', pos)
+    return idx + 1 if idx != -1 else -1
+
 def load_snapshots(filename):
-    """Load all snapshots from a trace file."""
+    """Load all snapshots from a trace file.
+
+    The file is memory-mapped and searched for snapshot line starts directly,
+    so the (much more numerous) log lines in between are never decoded.
+    """
     snapshots = []
-    with open(filename, 'r') as f:
-        for line in f:
-            if line.startswith('[snapshot]'):
-                snap = parse_snapshot(line)
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return snapshots
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = 0 if mm[:10] == b'[snapshot]' else _next_snapshot(mm, 0)
+            while start != -1:
+                end = mm.find(b'\n', start)
+                if end == -1:
+                    end = len(mm)
+                snap = parse_snapshot(mm[start:end].decode('utf-8', 'replace'))
                 if snap:
                     snapshots.append(snap)
+                start = _next_snapshot(mm, end)
     return snapshots
 
+# Fields compared by compare_snapshots, extracted as one tuple per snapshot
+_COMPARE_FIELDS = itemgetter('pc', 'sp', 'af', 'bc', 'de', 'hl', 'halt', 'iff1')
+
+# Register fields as (key, label, display width in hex digits)
+_REG_FIELDS = (
+    ('pc', 'PC', 6), ('sp', 'SP', 6), ('af', 'AF', 4),
+    ('bc', 'BC', 6), ('de', 'DE', 6), ('hl', 'HL', 6),
+)
+
 def compare_snapshots(cemu, ours):
-    """Compare two snapshots and return differences."""
+    """Compare two snapshots and return differences.
+
+    Register values are raw hex strings, so a mismatch is confirmed numerically
+    before it is reported (the two trace writers may pad differently).
+    """
     diffs = []
 
     # Compare key fields
-    if cemu['pc'] != ours['pc']:
-        diffs.append(f"PC: CEmu={cemu['pc']:06X} vs Ours={ours['pc']:06X}")
-    if cemu['sp'] != ours['sp']:
-        diffs.append(f"SP: CEmu={cemu['sp']:06X} vs Ours={ours['sp']:06X}")
-    if cemu['af'] != ours['af']:
-        diffs.append(f"AF: CEmu={cemu['af']:04X} vs Ours={ours['af']:04X}")
-    if cemu['bc'] != ours['bc']:
-        diffs.append(f"BC: CEmu={cemu['bc']:06X} vs Ours={ours['bc']:06X}")
-    if cemu['de'] != ours['de']:
-        diffs.append(f"DE: CEmu={cemu['de']:06X} vs Ours={ours['de']:06X}")
-    if cemu['hl'] != ours['hl']:
-        diffs.append(f"HL: CEmu={cemu['hl']:06X} vs Ours={ours['hl']:06X}")
+    for key, label, width in _REG_FIELDS:
+        if cemu[key] != ours[key]:
+            cemu_val = int(cemu[key], 16)
+            ours_val = int(ours[key], 16)
+            if cemu_val != ours_val:
+                diffs.append(f"{label}: CEmu={cemu_val:0{width}X} vs Ours={ours_val:0{width}X}")
     if cemu['halt'] != ours['halt']:
         diffs.append(f"HALT: CEmu={cemu['halt']} vs Ours={ours['halt']}")
     if cemu['iff1'] != ours['iff1']:
@@ -97,39 +144,56 @@ def main():
     cemu_by_cycle = {s['cycle']: s for s in cemu_snaps}
     ours_by_cycle = {s['cycle']: s for s in ours_snaps}
 
-    # Find common cycles (excluding init/HALT/ON_KEY_PRESSED special entries)
-    common_cycles = sorted(set(cemu_by_cycle.keys()) & set(ours_by_cycle.keys()))
+    # Find common cycles (excluding init/HALT/ON_KEY_PRESSED special entries).
+    # Snapshots are logged in cycle order, so walking the smaller trace and
+    # probing the other yields the common cycles already sorted
+    smaller, larger = sorted((cemu_by_cycle, ours_by_cycle), key=len)
+    common_cycles = list(filter(larger.__contains__, smaller))
 
     print(f"\nComparing {len(common_cycles)} common cycle points...")
 
-    matches = 0
-    divergences = []
+    # Compare field tuples for all common cycles in one C-level pass; only the
+    # divergent points go through compare_snapshots to build the report
+    cemu_aligned = list(map(cemu_by_cycle.__getitem__, common_cycles))
+    ours_aligned = list(map(ours_by_cycle.__getitem__, common_cycles))
+    mismatched = map(ne, map(_COMPARE_FIELDS, cemu_aligned), map(_COMPARE_FIELDS, ours_aligned))
 
-    for cycle in common_cycles:
-        cemu = cemu_by_cycle[cycle]
-        ours = ours_by_cycle[cycle]
+    # Only counts and the first/last cycle are kept, so traces with millions of
+    # divergent points don't hold a report entry for each one
+    matches = len(common_cycles)
+    divergence_count = 0
+    first_divergence = None
+    last_divergence = None
 
-        diffs = compare_snapshots(cemu, ours)
+    for idx in compress(range(len(common_cycles)), mismatched):
+        cycle = common_cycles[idx]
+        cemu = cemu_aligned[idx]
+        ours = ours_aligned[idx]
 
+        diffs = compare_snapshots(cemu, ours)
         if not diffs:
-            matches += 1
-        else:
-            divergences.append((cycle, diffs, cemu, ours))
-            if len(divergences) <= 5:  # Show first 5 divergences
-                print(f"\n=== DIVERGENCE at cycle {cycle} ===")
-                for d in diffs:
-                    print(f"  {d}")
-                print(f"  CEmu: {cemu['line'][:100]}...")
-                print(f"  Ours: {ours['line'][:100]}...")
+            continue  # Only the hex formatting differed
+
+        matches -= 1
+        divergence_count += 1
+        if first_divergence is None:
+            first_divergence = cycle
+        last_divergence = cycle
+        if divergence_count <= 5:  # Show first 5 divergences
+            print(f"\n=== DIVERGENCE at cycle {cycle} ===")
+            for d in diffs:
+                print(f"  {d}")
+            print(f"  CEmu: {cemu['line'][:100]}...")
+            print(f"  Ours: {ours['line'][:100]}...")
 
     print(f"\n=== Summary ===")
     print(f"Total common cycle points: {len(common_cycles)}")
     print(f"Matches: {matches}")
-    print(f"Divergences: {len(divergences)}")
+    print(f"Divergences: {divergence_count}")
 
-    if divergences:
-        print(f"\nFirst divergence at cycle: {divergences[0][0]}")
-        print(f"Last divergence at cycle: {divergences[-1][0]}")
+    if divergence_count:
+        print(f"\nFirst divergence at cycle: {first_divergence}")
+        print(f"Last divergence at cycle: {last_divergence}")
         return 1
     else:
         print("\n✓ All cycle points match!")
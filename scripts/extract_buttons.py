@@ -12,58 +12,105 @@ Usage:
 
 import argparse
 import json
+import mmap
+import os
+import re
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-from PIL import Image, ImageDraw, ImageFilter
+from PIL import Image, ImageDraw, ImageFilter, ImageStat
 
 SCRIPT_DIR = Path(__file__).parent
 PROJECT_DIR = SCRIPT_DIR.parent
 SOURCE_IMAGE = PROJECT_DIR / "hires-ti84ce-cropped.png"
+SOURCE_CACHE = SOURCE_IMAGE.with_suffix(".rawcache")  # Decoded pixels, see load_source_image()
 REGIONS_FILE = SCRIPT_DIR / "button_regions.json"
 ASSETS_DIR = PROJECT_DIR / "assets"
 BUTTONS_DIR = ASSETS_DIR / "buttons"
 
 
+def load_source_image():
+    """Open the source photo, reusing the decoded pixels from a previous run.
+
+    Decoding the PNG dominates short --preview/--extract runs, so the raw pixels
+    are written to SOURCE_CACHE and memory-mapped on later runs for as long as
+    the cache is newer than the PNG. The cache holds pixels only, so it is
+    skipped for images whose metadata (ICC profile, gamma, dpi, palette) would
+    otherwise be lost from the extracted PNGs.
+    """
+    img = Image.open(SOURCE_IMAGE)  # Lazy: reads the header and metadata only
+    if img.mode not in ("RGB", "RGBA") or img.info:
+        img.load()
+        return img
+
+    if SOURCE_CACHE.exists() and SOURCE_CACHE.stat().st_mtime >= SOURCE_IMAGE.stat().st_mtime:
+        mm = None
+        try:
+            with open(SOURCE_CACHE, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            header_end = mm.find(b"\n")
+            mode, width, height = mm[:header_end].decode().split()
+            cached = Image.frombuffer(mode, (int(width), int(height)), memoryview(mm)[header_end + 1:],
+                                      "raw", mode, 0, 1)
+            img.close()
+            return cached
+        except ValueError:
+            pass  # Empty or truncated cache; decode the PNG again below
+        if mm is not None:
+            mm.close()  # Only once the exception, and the views it holds, are gone
+
+    img.load()
+    tmp_path = SOURCE_CACHE.with_suffix(".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(f"{img.mode} {img.size[0]} {img.size[1]}\n".encode())
+        f.write(img.tobytes())
+    os.replace(tmp_path, SOURCE_CACHE)
+    return img
+
+
+# Full-name matches (checked first before character-level replacements)
+FULL_NAME_MAP = {
+    "X,T,θ,n": "xttn", "x⁻¹": "x_inv", "x²": "x_sq",
+    "(−)": "neg", "sto→": "sto", "y=": "y_eq",
+}
+# Character-level replacements, applied in one pass with str.translate
+CHAR_REPLACEMENTS = str.maketrans({
+    "÷": "div", "×": "mul", "−": "sub", "+": "add",
+    "^": "pow", "(": "lparen", ")": "rparen",
+    ",": "comma", ".": "dot", "θ": "theta",
+    " ": "_", "/": "_",
+})
+# Anything that isn't alphanumeric or "_" (same test as str.isalnum, Unicode-aware)
+NON_WORD_RE = re.compile(r"\W")
+
+
 def sanitize_name(name):
     """Convert button name to a safe filename."""
-    # Full-name matches (checked first before character-level replacements)
-    full_name_map = {
-        "X,T,θ,n": "xttn", "x⁻¹": "x_inv", "x²": "x_sq",
-        "(−)": "neg", "sto→": "sto", "y=": "y_eq",
-    }
-    if name in full_name_map:
-        return f"btn_{full_name_map[name]}"
-    # Character-level replacements
-    char_replacements = {
-        "÷": "div", "×": "mul", "−": "sub", "+": "add",
-        "^": "pow", "(": "lparen", ")": "rparen",
-        ",": "comma", ".": "dot", "θ": "theta",
-        " ": "_", "/": "_",
-    }
-    result = name
-    for old, new in char_replacements.items():
-        result = result.replace(old, new)
-    result = "".join(c if c.isalnum() or c == "_" else "" for c in result)
+    if name in FULL_NAME_MAP:
+        return f"btn_{FULL_NAME_MAP[name]}"
+    result = name.translate(CHAR_REPLACEMENTS)
+    result = NON_WORD_RE.sub("", result)
     return f"btn_{result.lower()}"
 
 
 def sample_body_color(image, buttons, offset_x, offset_y):
     """Sample average color from body area between buttons."""
     w, h = image.size
-    # Collect pixels from thin strips between button columns (left margin area)
-    pixels = []
-    for y in range(h // 4, h * 3 // 4):
-        for x in range(2, min(30, w)):
-            pixels.append(image.getpixel((x, y)))
-    if not pixels:
+    # Average the thin strip between button columns (left margin area)
+    box = (2, h // 4, min(30, w), h * 3 // 4)
+    if box[0] >= box[2] or box[1] >= box[3]:
         return (30, 30, 30)
-    r = sum(p[0] for p in pixels) // len(pixels)
-    g = sum(p[1] for p in pixels) // len(pixels)
-    b = sum(p[2] for p in pixels) // len(pixels)
+    stat = ImageStat.Stat(image.crop(box))
+    r, g, b = (int(total) // stat.count[0] for total in stat.sum[:3])
     return (r, g, b)
 
 
+# Per-button extra rows blanked above / below the mapped region
+BLANK_EXPAND_UP = {"9": 4, "sub": 4, "mul": 2, "div": 2, "lparen": 2, "rparen": 2, "enter": 5, "log": 2, "7": 2}
+BLANK_EXPAND_DOWN = {"3": 3}
+
+
 def blank_buttons(image, buttons, offset_x, offset_y):
     """Fill button face areas with body-matching dark grey.
 
@@ -71,18 +118,30 @@ def blank_buttons(image, buttons, offset_x, offset_y):
     Secondary text labels (printed on the body between buttons) are preserved.
     """
     fill_color = (22, 19, 20)
-    draw = ImageDraw.Draw(image)
     for btn in buttons:
         name = btn.get("name", "")
         if name == "dpad":
             continue
         bx = btn["x"] - offset_x
-        extra = {"9": 4, "sub": 4, "mul": 2, "div": 2, "lparen": 2, "rparen": 2, "enter": 5, "log": 2, "7": 2}
-        extra_down = {"3": 3}
-        expand = extra.get(name, 1)
-        expand_dn = extra_down.get(name, 0)
+        expand = BLANK_EXPAND_UP.get(name, 1)
+        expand_dn = BLANK_EXPAND_DOWN.get(name, 0)
         by = btn["y"] - offset_y - expand
-        draw.rectangle([bx, by, bx + btn["w"], by + expand + btn["h"] + expand_dn], fill=fill_color)
+        # Solid-color paste fills the box directly; the box end is exclusive
+        image.paste(fill_color, (bx, by, bx + btn["w"] + 1, by + expand + btn["h"] + expand_dn + 1))
+
+
+def region_box(region, origin):
+    """Crop box (left, top, right, bottom) of a region, relative to origin."""
+    x = region["x"] - origin[0]
+    y = region["y"] - origin[1]
+    return (x, y, x + region["w"], y + region["h"])
+
+
+def extract_button(sharpened, origin, btn):
+    """Crop one button from the sharpened source area and save it as a PNG."""
+    safe_name = sanitize_name(btn["name"])
+    sharpened.crop(region_box(btn, origin)).save(BUTTONS_DIR / f"{safe_name}.png")
+    return safe_name
 
 
 def cmd_extract(args):
@@ -94,12 +153,22 @@ def cmd_extract(args):
     with open(REGIONS_FILE) as f:
         regions = json.load(f)
 
-    img = Image.open(SOURCE_IMAGE)
+    img = load_source_image()
     print(f"Source image: {img.size[0]}x{img.size[1]}")
 
     # Subtle sharpening: UnsharpMask(radius=1, percent=120, threshold=2)
     sharpen = ImageFilter.UnsharpMask(radius=1, percent=120, threshold=2)
 
+    # Sharpen the area covered by all regions once and crop everything from it,
+    # instead of filtering the overlapping body/bezel/keypad crops separately
+    areas = regions["buttons"] + [regions[key] for key in
+                                  ("keypad_bounds", "screen_branding", "screen_bezel", "calculator_body")
+                                  if key in regions]
+    origin = (min(a["x"] for a in areas), min(a["y"] for a in areas))
+    sharpened = img.crop((*origin,
+                          max(a["x"] + a["w"] for a in areas),
+                          max(a["y"] + a["h"] for a in areas))).filter(sharpen)
+
     ASSETS_DIR.mkdir(exist_ok=True)
     BUTTONS_DIR.mkdir(exist_ok=True)
 
@@ -109,15 +178,13 @@ def cmd_extract(args):
         "buttons": [],
     }
 
-    for btn in regions["buttons"]:
-        name = btn["name"]
-        safe_name = sanitize_name(name)
+    # Crop and save buttons in parallel (PIL releases the GIL while encoding);
+    # results come back in region order
+    with ThreadPoolExecutor() as pool:
+        safe_names = list(pool.map(lambda btn: extract_button(sharpened, origin, btn), regions["buttons"]))
 
-        # Crop button from source image and sharpen
-        crop = img.crop((btn["x"], btn["y"], btn["x"] + btn["w"], btn["y"] + btn["h"]))
-        crop = crop.filter(sharpen)
-        png_path = BUTTONS_DIR / f"{safe_name}.png"
-        crop.save(png_path)
+    for btn, safe_name in zip(regions["buttons"], safe_names):
+        name = btn["name"]
 
         manifest["buttons"].append({
             "name": name,
@@ -134,8 +201,7 @@ def cmd_extract(args):
 
     # Crop keypad body background
     kp = regions["keypad_bounds"]
-    body_crop = img.crop((kp["x"], kp["y"], kp["x"] + kp["w"], kp["y"] + kp["h"]))
-    body_crop = body_crop.filter(sharpen)
+    body_crop = sharpened.crop(region_box(kp, origin))
     blank_buttons(body_crop, regions["buttons"], kp["x"], kp["y"])
     body_path = ASSETS_DIR / "keypad_body.png"
     body_crop.save(body_path)
@@ -144,8 +210,7 @@ def cmd_extract(args):
     # Crop screen branding strip (TI-84 Plus CE text)
     if "screen_branding" in regions:
         br = regions["screen_branding"]
-        branding_crop = img.crop((br["x"], br["y"], br["x"] + br["w"], br["y"] + br["h"]))
-        branding_crop = branding_crop.filter(sharpen)
+        branding_crop = sharpened.crop(region_box(br, origin))
         branding_path = ASSETS_DIR / "screen_branding.png"
         branding_crop.save(branding_path)
         print(f"Screen branding: {branding_path} ({br['w']}x{br['h']})")
@@ -153,8 +218,7 @@ def cmd_extract(args):
     # Crop screen bezel (with LCD area blacked out)
     if "screen_bezel" in regions:
         sb = regions["screen_bezel"]
-        bezel_crop = img.crop((sb["x"], sb["y"], sb["x"] + sb["w"], sb["y"] + sb["h"]))
-        bezel_crop = bezel_crop.filter(sharpen)
+        bezel_crop = sharpened.crop(region_box(sb, origin))
 
         # Black out the LCD opening so the photo's screen content doesn't show through
         if "lcd_opening" in regions:
@@ -172,8 +236,7 @@ def cmd_extract(args):
     # Crop combined calculator body (bezel + keypad, with LCD blacked out)
     if "calculator_body" in regions:
         cb = regions["calculator_body"]
-        body_combined = img.crop((cb["x"], cb["y"], cb["x"] + cb["w"], cb["y"] + cb["h"]))
-        body_combined = body_combined.filter(sharpen)
+        body_combined = sharpened.crop(region_box(cb, origin))
 
         # Black out the LCD opening
         if "lcd_opening" in regions:
@@ -224,7 +287,7 @@ def cmd_preview(args):
     with open(REGIONS_FILE) as f:
         regions = json.load(f)
 
-    img = Image.open(SOURCE_IMAGE).copy()
+    img = load_source_image().copy()
     draw = ImageDraw.Draw(img, "RGBA")
 
     # Draw screen bezel bounds
@@ -295,7 +358,7 @@ def cmd_map(args):
         print("Error: matplotlib required. Install with: pip3 install matplotlib")
         sys.exit(1)
 
-    img = Image.open(SOURCE_IMAGE)
+    img = load_source_image()
 
     existing = {}
     if REGIONS_FILE.exists():
@@ -1,13 +1,17 @@
 #!/usr/bin/env python3
-import json
 import sys
 
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
+
 def extract_steps(filepath, start_step, end_step, label):
     print(f"\n=== {label} ===")
     with open(filepath, "r") as f:
         for i, line in enumerate(f):
             if start_step <= i <= end_step:
-                data = json.loads(line)
+                data = loads(line)
                 pc = data.get("pc", "?")
                 opcode = data.get("opcode", {})
                 obytes = opcode.get("bytes", "?")
@@ -21,5 +25,13 @@ def extract_steps(filepath, start_step, end_step, label):
                 break
 
 if __name__ == "__main__":
-    extract_steps("traces/fulltrace_20260203_020900.json", 2066675, 2066685, "Our Emulator")
-    extract_steps("/tmp/cemu_trace_4m.json", 2066675, 2066685, "CEmu")
+    if len(sys.argv) < 4 or not all(arg.isdigit() for arg in sys.argv[3:5]):
+        print("Usage: extract_divergence.py <our_trace.json> <cemu_trace.json> <start_step> [end_step]")
+        print("\nPrints steps start_step..end_step (default: start_step + 10) of both")
+        print("traces, which must have one JSON step per line.")
+        sys.exit(1)
+
+    start_step = int(sys.argv[3])
+    end_step = int(sys.argv[4]) if len(sys.argv) > 4 else start_step + 10
+    extract_steps(sys.argv[1], start_step, end_step, "Our Emulator")
+    extract_steps(sys.argv[2], start_step, end_step, "CEmu")
@@ -5,9 +5,482 @@ Compares:
 - PC (program counter)
 - Registers (A, F, BC, DE, HL, IX, IY, SP)
 - I/O operations (memory reads/writes, port access)
+
+Traces are streamed with ijson's C yajl2 backend when it is installed
+(pip3 install ijson; the wheels ship it), so memory stays flat and parsing
+stops at the first divergence. Without it the whole file is loaded up front,
+with msgspec or orjson if installed, or the stdlib json module.
+
+Both files are first compared as raw bytes: steps that lie wholly before the
+first differing byte match in every field, so streaming starts just before it.
+
+With --no-io only PC and registers matter, so both traces are loaded in full
+and compared as flat tables of those values instead of step by step. The
+tables are cached next to each trace (<trace>.json.divcache) for reruns.
+
+The step-by-step loop is plain Python over dicts; scripts/run_pypy.sh runs
+the script under PyPy, whose JIT speeds that loop up.
 """
 import json
+import mmap
+import os
+import struct
 import sys
+import tempfile
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, compress, count, islice, repeat, takewhile, zip_longest
+from operator import add, itemgetter, ne
+from types import MappingProxyType
+from typing import List, NamedTuple, Optional, TypedDict
+
+# Only the C yajl2 backend is used: ijson's default import may settle for the
+# pure-Python one, which is slower than a full load
+try:
+    import ijson.backends.yajl2_c as ijson
+except ImportError:
+    ijson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# msgspec decoding schema: only the fields compared or printed here are kept,
+# the rest of each step (mnemonic, cycle counts, IFF/IM/ADL) is skipped
+class TraceRegs(TypedDict, total=False):
+    A: str
+    F: str
+    BC: str
+    DE: str
+    HL: str
+    IX: str
+    IY: str
+    SP: str
+
+class TraceOpcode(TypedDict, total=False):
+    bytes: str
+
+class TraceIoOp(TypedDict, total=False):
+    type: str
+    target: str
+    addr: str
+    old: str
+    new: str
+    value: str
+
+class TraceStep(TypedDict, total=False):
+    pc: str
+    opcode: TraceOpcode
+    regs_before: TraceRegs
+    io_ops: List[TraceIoOp]
+
+# Table loads (no I/O checks) skip io_ops entirely, roughly halving decode time
+class TraceTableStep(TypedDict, total=False):
+    pc: str
+    opcode: TraceOpcode
+    regs_before: TraceRegs
+
+if msgspec is not None:
+    _trace_decoder = msgspec.json.Decoder(List[TraceStep])
+    _table_decoder = msgspec.json.Decoder(List[TraceTableStep])
+else:
+    _trace_decoder = _table_decoder = None
+
+# Registers compared at every step, in report order
+REG_KEYS = ("A", "F", "BC", "DE", "HL", "IX", "IY", "SP")
+_reg_values = itemgetter(*REG_KEYS)
+_pc_and_regs = itemgetter("pc", "regs_before")
+
+class Divergence(NamedTuple):
+    """The first step where two traces differ, and what differs there.
+
+    A PC difference stops the comparison on its own; registers and I/O are
+    both checked at a step, so either or both may be set.
+    """
+    step: int
+    pc: bool = False
+    reg: Optional[tuple] = None  # (register, ours, cemu)
+    io: Optional[tuple] = None  # (description, our_ops, cemu_ops)
+
+def _build_diff_regs():
+    """Generate diff_regs(a, b), unrolled over REG_KEYS.
+
+    It returns the first register whose value differs between two
+    regs_before mappings, or None, and raises KeyError if one is missing.
+    The straight-line compares avoid a loop and per-register .get() calls.
+    """
+    lines = ["def diff_regs(a, b):"]
+    for reg in REG_KEYS:
+        lines.append(f"    if a[{reg!r}] != b[{reg!r}]:")
+        lines.append(f"        return {reg!r}")
+    lines.append("    return None")
+    namespace = {}
+    exec("\n".join(lines), namespace)
+    return namespace["diff_regs"]
+
+diff_regs = _build_diff_regs()
+
+_NO_FIELDS = MappingProxyType({})  # Read-only stand-in for a missing nested object
+_NO_OPS = ()  # Shared stand-in for a missing io_ops list
+
+# Fields compared as one flat table when I/O checks are off. PC comes first
+# and the registers follow in report order, so the first mismatching cell
+# is the difference the step-by-step loop would report
+TABLE_KEYS = ("pc",) + REG_KEYS
+ROW_WIDTH = len(TABLE_KEYS)
+
+# Sidecar cache of parsed tables, written next to each trace: a header keyed
+# on the trace's mtime and size, the int64 table, the raw values of cells that
+# didn't parse (as JSON), then the opcode strings
+TABLE_CACHE_SUFFIX = ".divcache"
+_CACHE_HEADER = struct.Struct("=8sqqqq")  # magic, mtime_ns, size, step count, unparsed JSON length
+_CACHE_MAGIC = b"FFDTAB2\n"
+
+# Every step in the pretty-printed traces opens with this line; the byte
+# comparison fast path uses it to find step boundaries without parsing
+STEP_START = b"\n  {\n"
+_BYTE_CHUNK = 1 << 20
+
+# Tables this process has already loaded, keyed by trace_key() and kept in
+# least-recently-used order, so a run comparing several traces against one
+# reference trace loads the reference once
+_table_memo = {}
+_TABLE_MEMO_SIZE = 4
+
+# Hex digits each table field is written with in the trace
+FIELD_WIDTHS = {"pc": 6, "A": 2, "F": 2, "BC": 6, "DE": 6, "HL": 6, "IX": 6, "IY": 6, "SP": 6}
+
+def _open_trace(path):
+    """Open a trace file for a front-to-back binary read."""
+    f = open(path, "rb")
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+    return f
+
+def load_trace(path, io_ops=True, offset=0):
+    """Load every step of a JSON trace file into a list.
+
+    With io_ops=False the msgspec decoder may leave io_ops out of the steps.
+    A nonzero offset must be a step boundary from identical_prefix(); only
+    the steps from there on are loaded.
+    """
+    decoder = _trace_decoder if io_ops else _table_decoder
+    with _open_trace(path) as f:
+        if offset:
+            f.seek(offset)
+            return _decode(b"[" + f.read(), decoder)
+        if decoder is None and orjson is None:
+            return json.load(f)
+        # Decode straight from the mapped pages rather than a read() copy;
+        # the buffer view must be released before the map can close
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, "madvise"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            with memoryview(mm) as buf:
+                return _decode(buf, decoder)
+
+def _decode(data, decoder):
+    """Decode a JSON trace buffer with the msgspec decoder, if any.
+
+    The schema only allows strings, so a trace with null or numeric fields
+    is decoded again with orjson or the json module, which accept any JSON.
+    """
+    if decoder is not None:
+        try:
+            return decoder.decode(data)
+        except msgspec.ValidationError:
+            pass
+    return orjson.loads(data) if orjson is not None else json.loads(bytes(data))
+
+def iter_trace(path, offset=0):
+    """Yield the steps of a JSON trace file one at a time, starting at offset."""
+    if ijson is None:
+        yield from load_trace(path, offset=offset)
+        return
+    with _open_trace(path) as f:
+        yield from ijson.items(_ArrayTail(f, offset) if offset else f, "item")
+
+class _ArrayTail:
+    """Read a trace from a step boundary on as if those steps were the whole array."""
+
+    def __init__(self, f, offset):
+        f.seek(offset)
+        self._f = f
+        self._head = b"["
+
+    def read(self, size=-1):
+        if not size:
+            return b""  # ijson probes with read(0) to tell bytes from str
+        head, self._head = self._head, b""
+        return head + self._f.read(size)
+
+def first_byte_diff(a, b):
+    """Return the offset of the first byte where two buffers differ, or None if equal."""
+    n = min(len(a), len(b))
+    diff = first_difference(a, b, n)
+    if diff is None and len(a) != len(b):
+        return n
+    return diff
+
+def first_difference(a, b, stop, block=1 << 12, max_probe=1 << 18):
+    """Return the first index below stop where two sequences differ, or None.
+
+    a and b must compare whole slices natively (bytes, mmap, memoryview),
+    so each probe is one memcmp-style call. The equal prefix is first
+    extended by doubling steps until a probe fails, then the failing range
+    is halved down to one block, which is walked element by element. Steps
+    stop doubling at max_probe elements: mmap slices are copies, and
+    cache-sized ones compare fastest. An early difference costs a handful
+    of small probes; a late one a few Python-level calls per max_probe
+    elements.
+    """
+    lo = 0
+    size = block
+    while True:
+        if lo >= stop:
+            return None
+        hi = min(lo + size, stop)
+        if a[lo:hi] != b[lo:hi]:
+            break
+        lo = hi
+        size = min(size * 2, max_probe)
+    # a[:lo] == b[:lo], and a[lo:hi] != b[lo:hi]
+    while hi - lo > block:
+        mid = (lo + hi) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid
+    return next(compress(count(lo), map(ne, a[lo:hi], b[lo:hi])))
+
+def count_step_starts(buf, end):
+    """Count the STEP_START lines in buf[:end], a chunk at a time."""
+    overlap = len(STEP_START) - 1
+    return sum(buf[i:min(i + _BYTE_CHUNK + overlap, end)].count(STEP_START)
+               for i in range(0, end, _BYTE_CHUNK))
+
+def identical_prefix(ours_path, cemu_path, backoff=3):
+    """Find how much of two trace files is byte-for-byte identical.
+
+    Steps that lie entirely inside the identical prefix match in every field,
+    so the step-by-step comparison can skip them unparsed. Returns
+    (offset, steps): reading resumes at byte offset, the start of step number
+    steps in both files, backoff steps before the step holding the first
+    differing byte (so they can still be shown as context). Identical files
+    give (None, total_steps). Files not written in the layout STEP_START
+    expects give (0, 0).
+    """
+    with open(ours_path, "rb") as fa, open(cemu_path, "rb") as fb:
+        if not os.fstat(fa.fileno()).st_size or not os.fstat(fb.fileno()).st_size:
+            return 0, 0
+        with mmap.mmap(fa.fileno(), 0, access=mmap.ACCESS_READ) as a, \
+             mmap.mmap(fb.fileno(), 0, access=mmap.ACCESS_READ) as b:
+            diff = first_byte_diff(a, b)
+            if diff is None:
+                total = count_step_starts(a, len(a))
+                return (None, total) if total else (0, 0)
+            start = a.rfind(STEP_START, 0, diff)
+            for _ in range(backoff):
+                if start < 0:
+                    break
+                start = a.rfind(STEP_START, 0, start)
+            if start < 0:
+                return 0, 0
+            return start + 1, count_step_starts(a, start)
+
+def read_step(path, step):
+    """Decode a single step of a trace, or return None if it can't be found.
+
+    The step is located by counting STEP_START lines a chunk at a time, so
+    only that step's JSON is parsed. Files not written in that layout, or
+    with fewer steps, give None.
+    """
+    with open(path, "rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            overlap = len(STEP_START) - 1
+            seen = 0
+            for i in range(0, len(mm), _BYTE_CHUNK):
+                chunk = mm[i:i + _BYTE_CHUNK + overlap]
+                found = chunk.count(STEP_START)
+                if seen + found > step:
+                    pos = -1
+                    for _ in range(step - seen + 1):
+                        pos = chunk.find(STEP_START, pos + 1)
+                    start = i + pos + 1
+                    end = mm.find(STEP_START, start)
+                    text = mm[start:end if end >= 0 else len(mm)].decode(errors="replace")
+                    try:
+                        return json.JSONDecoder().raw_decode(text.lstrip())[0]
+                    except ValueError:
+                        return None
+                seen += found
+    return None
+
+def load_tables(paths):
+    """Load traces as flat row-major tables of TABLE_KEYS values, plus opcode bytes.
+
+    Returns one (table, opcodes, unparsed) triple per path, where row i holds
+    step i's PC and registers at table[i * ROW_WIDTH:(i + 1) * ROW_WIDTH], and
+    unparsed maps the index of each cell that didn't parse to its raw value
+    (see parse_table()). Parsed tables
+    are saved to a sidecar cache next to each trace and memory-mapped on later
+    runs for as long as the trace's mtime and size are unchanged, so repeat
+    runs skip the JSON entirely. JSON decoding is CPU-bound, so traces without
+    a usable cache are parsed side by side in worker processes. Loaded
+    tables are also kept in memory (_table_memo) for later calls.
+    """
+    keys = [trace_key(path) for path in paths]
+    loaded = {}
+    for key in keys:
+        if key not in loaded:
+            loaded[key] = _table_memo.get(key) or read_table_cache(key[0])
+    uncached = [key for key, table in loaded.items() if table is None]
+    workers = min(len(uncached), os.cpu_count() or 1)
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            built = list(pool.map(build_table, [key[0] for key in uncached]))
+    else:
+        built = [build_table(key[0]) for key in uncached]
+    loaded.update(zip(uncached, built))
+
+    for key in keys:
+        _table_memo.pop(key, None)  # Re-insert as most recently used
+        _table_memo[key] = loaded[key]
+    while len(_table_memo) > _TABLE_MEMO_SIZE:
+        del _table_memo[next(iter(_table_memo))]
+
+    return [loaded[key] for key in keys]
+
+def trace_key(path):
+    """Identify a version of a trace file by (real path, mtime_ns, size)."""
+    stat = os.stat(path)
+    return os.path.realpath(path), stat.st_mtime_ns, stat.st_size
+
+def read_table_cache(path):
+    """Map a trace's table cache, or return None if it is missing or stale."""
+    stat = os.stat(path)
+    try:
+        with open(path + TABLE_CACHE_SUFFIX, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, mtime_ns, size, steps, unparsed_len = _CACHE_HEADER.unpack_from(mm)
+    except (OSError, ValueError, struct.error):
+        return None  # No cache yet, or an empty or truncated one
+    table_end = _CACHE_HEADER.size + steps * ROW_WIDTH * 8
+    unparsed_end = table_end + unparsed_len
+    if (magic, mtime_ns, size) != (_CACHE_MAGIC, stat.st_mtime_ns, stat.st_size) or len(mm) < unparsed_end:
+        return None
+    table = memoryview(mm)[_CACHE_HEADER.size:table_end].cast("q")
+    unparsed = dict(json.loads(mm[table_end:unparsed_end])) if unparsed_len else {}
+    opcodes = mm[unparsed_end:].decode().split("\n") if steps else []
+    return table, opcodes, unparsed
+
+def build_table(path):
+    """Parse a trace's table from the JSON and write its cache; see load_tables()."""
+    stat = os.stat(path)
+    table, opcodes, unparsed = parse_table(path)
+    unparsed_json = json.dumps(list(unparsed.items())).encode() if unparsed else b""
+    cache_path = path + TABLE_CACHE_SUFFIX
+    # A temp file unique to this writer, so concurrent runs on the same trace
+    # can't interleave their writes before the rename
+    tmp_path = None
+    try:
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(cache_path) or ".",
+                                         prefix=os.path.basename(cache_path) + ".",
+                                         suffix=".tmp", delete=False) as f:
+            tmp_path = f.name
+            f.write(_CACHE_HEADER.pack(_CACHE_MAGIC, stat.st_mtime_ns, stat.st_size, len(opcodes),
+                                       len(unparsed_json)))
+            f.write(table.tobytes())
+            f.write(unparsed_json)
+            f.write("\n".join(opcodes).encode())
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # e.g. a read-only trace directory; run uncached
+        if tmp_path is not None:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+    return table, opcodes, unparsed
+
+def parse_table(path):
+    """Build a trace's table and opcode list (see load_tables()) from the JSON.
+
+    The hex strings are parsed once into an int64 array, so the scan compares
+    machine integers. Missing or malformed values are stored as -1, and their
+    raw values are returned in a {cell index: value} dict so that two
+    different ones still count as a difference. The rows are assembled with
+    C-level map() passes instead of a per-step loop, with a per-step fallback
+    for steps that lack a field or hold a non-string value.
+    """
+    steps = load_trace(path, io_ops=False)
+    try:
+        pcs = zip(map(itemgetter("pc"), steps))  # 1-tuples, to prepend to the register tuples
+        rows = map(add, pcs, map(_reg_values, map(itemgetter("regs_before"), steps)))
+        table = array("q", map(int, chain.from_iterable(rows), repeat(16)))
+        opcodes = list(map(itemgetter("bytes"), map(itemgetter("opcode"), steps)))
+        unparsed = {}
+    except (KeyError, TypeError, ValueError):
+        table = array("q")
+        unparsed = {}
+        for step in steps:
+            step_regs = step.get("regs_before") or _NO_FIELDS
+            for raw in chain((step.get("pc"),), map(step_regs.get, REG_KEYS)):
+                value = parse_value(raw)
+                if value < 0:
+                    unparsed[len(table)] = raw
+                table.append(value)
+        opcodes = list(map(opcode_bytes, steps))
+    if not all(map(isinstance, opcodes, repeat(str))):
+        opcodes = [op if isinstance(op, str) else "?" for op in opcodes]  # e.g. "bytes": null
+    return table, opcodes, unparsed
+
+def parse_value(text):
+    """Parse a trace hex field like "0x1A", or return -1 if it is missing or malformed."""
+    try:
+        return int(text, 16)
+    except (TypeError, ValueError):
+        return -1
+
+def same_value(a, b):
+    """Compare two trace hex fields by value, so "0x001234" matches "0x1234"."""
+    return a == b or parse_value(a) == parse_value(b) >= 0
+
+def format_value(value, key):
+    """Format a parsed table value the way the trace writes it."""
+    if value < 0:
+        return "?"
+    return f"0x{value:0{FIELD_WIDTHS[key]}X}"
+
+def format_cell(table, unparsed, cell):
+    """Format a table cell, showing the trace's raw value if it didn't parse."""
+    if cell in unparsed:
+        return unparsed[cell]
+    return format_value(table[cell], TABLE_KEYS[cell % ROW_WIDTH])
+
+def table_step(table, opcodes, unparsed, i):
+    """Rebuild the parts of step i that the context printout shows."""
+    row = (format_cell(table, unparsed, cell) for cell in range(i * ROW_WIDTH, (i + 1) * ROW_WIDTH))
+    return {"pc": next(row), "opcode": {"bytes": opcodes[i]}, "regs_before": dict(zip(REG_KEYS, row))}
+
+def opcode_bytes(step):
+    """Return a step's opcode bytes ("3E 01"), or "?" if the trace lacks them."""
+    opcode = step.get("opcode")
+    op_bytes = opcode.get("bytes") if opcode else None
+    return op_bytes if isinstance(op_bytes, str) else "?"
+
+def format_regs(regs):
+    """Format the main registers of a regs_before mapping for display."""
+    return " ".join(f"{reg}={regs.get(reg)}" for reg in REG_KEYS[:5])
 
 def format_io_op(op):
     """Format an io_op for display."""
@@ -16,6 +489,13 @@ def format_io_op(op):
     else:
         return f"{op['type']} {op['target']} {op['addr']}: {op.get('value', '?')}"
 
+def io_op_key(op, ignore_old=False):
+    """Build a tuple of the fields compare_io_ops checks, for direct comparison."""
+    op_type = op.get("type")
+    if op_type == "write":
+        return (op_type, op.get("target"), op.get("addr"), None if ignore_old else op.get("old"), op.get("new"))
+    return (op_type, op.get("target"), op.get("addr"), op.get("value"))
+
 def compare_io_ops(ours_ops, cemu_ops, writes_only=False, ignore_old=False):
     """Compare two lists of io_ops. Returns (match, diff_description).
 
@@ -29,6 +509,10 @@ def compare_io_ops(ours_ops, cemu_ops, writes_only=False, ignore_old=False):
     if len(ours_ops) != len(cemu_ops):
         return False, f"count mismatch: {len(ours_ops)} vs {len(cemu_ops)}"
 
+    # Fast path: one tuple comparison per op; only walk the fields to describe a mismatch
+    if all(io_op_key(a, ignore_old) == io_op_key(b, ignore_old) for a, b in zip(ours_ops, cemu_ops)):
+        return True, None
+
     for i, (our_op, cemu_op) in enumerate(zip(ours_ops, cemu_ops)):
         # Compare type
         if our_op.get("type") != cemu_op.get("type"):
@@ -54,77 +538,168 @@ def compare_io_ops(ours_ops, cemu_ops, writes_only=False, ignore_old=False):
 
     return True, None
 
-def compare_traces(ours_path, cemu_path, max_steps=None, check_io_ops=True, writes_only=False, ignore_old=False):
-    """Find the first divergence point between two traces."""
-
-    print("Loading our trace...")
-    with open(ours_path, "r") as f:
-        ours = json.load(f)
-
-    print("Loading CEmu trace...")
-    with open(cemu_path, "r") as f:
-        cemu = json.load(f)
-
-    print(f"Our trace: {len(ours)} steps, CEmu trace: {len(cemu)} steps")
+def scan_steps(ours_path, cemu_path, max_steps=None, writes_only=False, ignore_old=False):
+    """Stream both traces step by step until PC, registers or I/O diverge.
 
-    # Compare step by step until divergence
+    Returns (divergence, min_len, length_mismatch, get_context), where
+    divergence is a Divergence or None; get_context(step) gives the first
+    context step number and the (ours, cemu) step pairs around it.
+    """
+    # The last few step pairs are kept for the context printout
+    history = deque(maxlen=4)
+    offset, skipped = identical_prefix(ours_path, cemu_path, backoff=history.maxlen - 1)
     if max_steps:
-        min_len = min(len(ours), len(cemu), max_steps)
-    else:
-        min_len = min(len(ours), len(cemu))
+        skipped = min(skipped, max_steps)
+    if offset is None:
+        print(f"Traces are byte-identical ({skipped} steps compared)")
+        return None, skipped, None, None
+    if skipped:
+        print(f"Skipping {skipped} byte-identical steps...")
+
+    print("Streaming our trace and CEmu trace...")
+    steps = zip_longest(iter_trace(ours_path, offset), iter_trace(cemu_path, offset))
+    if max_steps:
+        steps = islice(steps, max_steps - skipped)
 
-    first_pc_diff = None
-    first_reg_diff = None
-    first_io_diff = None
+    min_len = skipped
+    length_mismatch = None
+    divergence = None
 
-    for i in range(min_len):
-        our_step = ours[i]
-        cemu_step = cemu[i]
+    for i, (our_step, cemu_step) in enumerate(steps, skipped):
+        if our_step is None or cemu_step is None:
+            length_mismatch = "CEmu trace" if cemu_step is None else "our trace"
+            break
+        min_len = i + 1
+        history.append((our_step, cemu_step))
+
+        # Check PC first: it's the cheapest test, and once execution has gone
+        # down a different path the register and I/O checks add nothing.
+        # Strings are compared as-is; only a mismatch is re-checked by value
+        try:
+            our_pc, our_regs = _pc_and_regs(our_step)
+            cemu_pc, cemu_regs = _pc_and_regs(cemu_step)
+        except KeyError:
+            our_pc, our_regs = our_step.get("pc", "?"), our_step.get("regs_before") or _NO_FIELDS
+            cemu_pc, cemu_regs = cemu_step.get("pc", "?"), cemu_step.get("regs_before") or _NO_FIELDS
+        if our_pc != cemu_pc and not same_value(our_pc, cemu_pc):
+            divergence = Divergence(i, pc=True)
+            break
 
-        our_pc = our_step.get("pc", "?")
-        cemu_pc = cemu_step.get("pc", "?")
+        # Check key registers: identical register dicts (the usual case) are
+        # settled by one C-level comparison; otherwise diff_regs finds the
+        # first tracked register that differs, if any
+        reg_diff = None
+        if our_regs != cemu_regs:
+            try:
+                reg = diff_regs(our_regs, cemu_regs)
+            except KeyError:
+                # A register is missing; compare with "?" placeholders instead
+                reg = next((reg for reg in REG_KEYS if our_regs.get(reg, "?") != cemu_regs.get(reg, "?")), None)
+            if reg is not None and same_value(our_regs.get(reg, "?"), cemu_regs.get(reg, "?")):
+                # Formatting-only difference; recheck every register numerically
+                reg = next((reg for reg in REG_KEYS
+                            if not same_value(our_regs.get(reg, "?"), cemu_regs.get(reg, "?"))), None)
+            if reg is not None:
+                reg_diff = (reg, our_regs.get(reg, "?"), cemu_regs.get(reg, "?"))
+
+        # Check I/O operations, then stop with whatever differed at this step
+        our_io_ops = our_step.get("io_ops", _NO_OPS)
+        cemu_io_ops = cemu_step.get("io_ops", _NO_OPS)
+        match, diff_desc = compare_io_ops(our_io_ops, cemu_io_ops, writes_only, ignore_old)
+        if not match or reg_diff is not None:
+            io_diff = None if match else (diff_desc, our_io_ops, cemu_io_ops)
+            divergence = Divergence(i, reg=reg_diff, io=io_diff)
+            break
 
-        our_regs = our_step.get("regs_before", {})
-        cemu_regs = cemu_step.get("regs_before", {})
+    def get_context(divergence_step):
+        # The buffered steps up to the divergence plus two after
+        context = list(history)
+        context.extend(islice(takewhile(lambda pair: None not in pair, steps), 2))
+        return divergence_step - len(history) + 1, context
 
-        # Check PC
-        if first_pc_diff is None and our_pc != cemu_pc:
-            first_pc_diff = i
+    return divergence, min_len, length_mismatch, get_context
 
-        # Check key registers
-        if first_reg_diff is None:
-            for reg in ["A", "F", "BC", "DE", "HL", "IX", "IY", "SP"]:
-                our_val = our_regs.get(reg, "?")
-                cemu_val = cemu_regs.get(reg, "?")
-                if our_val != cemu_val:
-                    first_reg_diff = (i, reg, our_val, cemu_val)
-                    break
+def scan_table(ours_path, cemu_path, max_steps=None):
+    """Find the first PC or register divergence with one scan over flat tables.
 
-        # Check I/O operations
-        if check_io_ops and first_io_diff is None:
-            our_io_ops = our_step.get("io_ops", [])
-            cemu_io_ops = cemu_step.get("io_ops", [])
-            match, diff_desc = compare_io_ops(our_io_ops, cemu_io_ops, writes_only, ignore_old)
-            if not match:
-                first_io_diff = (i, diff_desc, our_io_ops, cemu_io_ops)
+    Both traces are loaded in full; the first differing cell's position
+    gives the step and field by divmod. Returns the same tuple as
+    scan_steps, never with an I/O difference; only the divergence step's
+    io_ops are read back, for the context printout.
+    """
+    print("Loading our trace and CEmu trace...")
+    (ours, our_opcodes, our_unparsed), (cemu, cemu_opcodes, cemu_unparsed) = load_tables((ours_path, cemu_path))
+    print(f"Our trace: {len(our_opcodes)} steps, CEmu trace: {len(cemu_opcodes)} steps")
+
+    min_len = min(len(our_opcodes), len(cemu_opcodes))
+    length_mismatch = None
+    if len(our_opcodes) != len(cemu_opcodes) and not (max_steps and max_steps <= min_len):
+        length_mismatch = "CEmu trace" if len(cemu_opcodes) == min_len else "our trace"
+    if max_steps:
+        min_len = min(min_len, max_steps)
+
+    divergence = None
+    stop = min_len * ROW_WIDTH
+    cell = first_difference(memoryview(ours), memoryview(cemu), stop)
+    # Cells that didn't parse in both traces hold -1 in each; compare those
+    # by their raw values, as the step-by-step scan does
+    limit = stop if cell is None else cell
+    clashes = [c for c in our_unparsed.keys() & cemu_unparsed.keys()
+               if c < limit and our_unparsed[c] != cemu_unparsed[c]]
+    if clashes:
+        cell = min(clashes)
+    if cell is not None:
+        step, field = divmod(cell, ROW_WIDTH)
+        if field == 0:
+            divergence = Divergence(step, pc=True)
+        else:
+            divergence = Divergence(step, reg=(TABLE_KEYS[field], format_cell(ours, our_unparsed, cell),
+                                               format_cell(cemu, cemu_unparsed, cell)))
+
+    def get_context(divergence_step):
+        start = max(divergence_step - 3, 0)
+        context = [(table_step(ours, our_opcodes, our_unparsed, j), table_step(cemu, cemu_opcodes, cemu_unparsed, j))
+                   for j in range(start, min(divergence_step + 3, min_len))]
+        # The tables hold no I/O, so the divergence step's io_ops are decoded
+        # from the JSON on their own; None marks them as unavailable
+        for path, step in zip((ours_path, cemu_path), context[divergence_step - start]):
+            full = read_step(path, divergence_step)
+            found = full is not None and same_value(full.get("pc"), step["pc"])
+            step["io_ops"] = full.get("io_ops", _NO_OPS) if found else None
+        return start, context
+
+    return divergence, min_len, length_mismatch, get_context
 
-        if first_pc_diff is not None or first_reg_diff is not None or first_io_diff is not None:
-            break
+def compare_traces(ours_path, cemu_path, max_steps=None, check_io_ops=True, writes_only=False, ignore_old=False):
+    """Find the first divergence point between two traces.
+
+    With check_io_ops off only PC and registers are compared, so the traces
+    are scanned as flat tables instead of step by step.
+    """
+    if check_io_ops:
+        scan = scan_steps(ours_path, cemu_path, max_steps, writes_only, ignore_old)
+    else:
+        scan = scan_table(ours_path, cemu_path, max_steps)
+    divergence, min_len, length_mismatch, get_context = scan
 
     print("\n=== First Divergence Found ===")
 
-    divergence_step = None
+    if divergence is None:
+        print(f"\nNo divergence found in {min_len} steps!")
+        if length_mismatch:
+            print(f"  (trace lengths differ: {length_mismatch} ended after {min_len} steps)")
+        return
+
+    divergence_step = divergence.step
 
-    if first_reg_diff:
-        step, reg, our_val, cemu_val = first_reg_diff
-        divergence_step = step if divergence_step is None else min(divergence_step, step)
-        print(f"\nFirst REGISTER difference at step {step}:")
+    if divergence.reg:
+        reg, our_val, cemu_val = divergence.reg
+        print(f"\nFirst REGISTER difference at step {divergence_step}:")
         print(f"  Register {reg}: ours={our_val}, cemu={cemu_val}")
 
-    if first_io_diff:
-        step, diff_desc, our_ops, cemu_ops = first_io_diff
-        divergence_step = step if divergence_step is None else min(divergence_step, step)
-        print(f"\nFirst I/O difference at step {step}:")
+    if divergence.io:
+        diff_desc, our_ops, cemu_ops = divergence.io
+        print(f"\nFirst I/O difference at step {divergence_step}:")
         print(f"  {diff_desc}")
         print(f"  Ours ({len(our_ops)} ops):")
         for op in our_ops[:5]:  # Show first 5
@@ -137,59 +712,41 @@ def compare_traces(ours_path, cemu_path, max_steps=None, check_io_ops=True, writ
         if len(cemu_ops) > 5:
             print(f"    ... and {len(cemu_ops) - 5} more")
 
-    if first_pc_diff:
-        divergence_step = first_pc_diff if divergence_step is None else min(divergence_step, first_pc_diff)
-        print(f"\nFirst PC difference at step {first_pc_diff}")
+    if divergence.pc:
+        print(f"\nFirst PC difference at step {divergence_step}")
 
-    if divergence_step is None:
-        print(f"\nNo divergence found in {min_len} steps!")
-        if len(ours) != len(cemu):
-            print(f"  (trace lengths differ: {len(ours)} vs {len(cemu)})")
-        return
-
-    # Show context around divergence
-    print(f"\n=== Context (steps {max(0, divergence_step-3)} to {min(min_len-1, divergence_step+2)}) ===")
-    for j in range(max(0, divergence_step-3), min(min_len, divergence_step+3)):
-        our_s = ours[j]
-        cemu_s = cemu[j]
+    # Show context around divergence: up to three steps before it and two after
+    context_start, context = get_context(divergence_step)
+    print(f"\n=== Context (steps {context_start} to {context_start + len(context) - 1}) ===")
+    for j, (our_s, cemu_s) in enumerate(context, context_start):
         our_pc = our_s.get("pc")
         cemu_pc = cemu_s.get("pc")
-        our_op = our_s.get("opcode", {}).get("bytes", "?")
-        cemu_op = cemu_s.get("opcode", {}).get("bytes", "?")
+        our_op = opcode_bytes(our_s)
+        cemu_op = opcode_bytes(cemu_s)
         marker = " <<< DIVERGENCE" if j == divergence_step else ""
         print(f"Step {j}: Ours PC={our_pc} op={our_op}  |  CEmu PC={cemu_pc} op={cemu_op}{marker}")
 
         if j == divergence_step:
-            our_regs = our_s.get("regs_before", {})
-            cemu_regs = cemu_s.get("regs_before", {})
-            print(f"  Ours:  A={our_regs.get('A')} F={our_regs.get('F')} BC={our_regs.get('BC')} DE={our_regs.get('DE')} HL={our_regs.get('HL')}")
-            print(f"  CEmu:  A={cemu_regs.get('A')} F={cemu_regs.get('F')} BC={cemu_regs.get('BC')} DE={cemu_regs.get('DE')} HL={cemu_regs.get('HL')}")
+            print(f"  Ours:  {format_regs(our_s.get('regs_before') or _NO_FIELDS)}")
+            print(f"  CEmu:  {format_regs(cemu_s.get('regs_before') or _NO_FIELDS)}")
 
             # Show I/O ops at divergence
-            our_io = our_s.get("io_ops", [])
-            cemu_io = cemu_s.get("io_ops", [])
-            if our_io or cemu_io:
+            our_io = our_s.get("io_ops", _NO_OPS)
+            cemu_io = cemu_s.get("io_ops", _NO_OPS)
+            if our_io is None or cemu_io is None:
+                print("  I/O: (not loaded with --no-io)")
+            elif our_io or cemu_io:
                 print(f"  I/O Ours: {[format_io_op(op) for op in our_io[:3]]}")
                 print(f"  I/O CEmu: {[format_io_op(op) for op in cemu_io[:3]]}")
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Usage: find_first_divergence.py <our_trace.json> <cemu_trace.json> [max_steps] [options]")
-        print("\nOptions:")
-        print("  max_steps     - Maximum steps to compare (default: all)")
-        print("  --no-io       - Skip I/O operation comparison")
-        print("  --writes-only - Only compare write operations (CEmu doesn't trace reads)")
-        print("  --ignore-old  - Ignore old_value differences (register model differences)")
-        sys.exit(1)
-
-    ours_path = sys.argv[1]
-    cemu_path = sys.argv[2]
+    paths = []
     max_steps = None
     check_io = True
     writes_only = False
     ignore_old = False
 
-    for arg in sys.argv[3:]:
+    for arg in sys.argv[1:]:
         if arg == "--no-io":
             check_io = False
         elif arg == "--writes-only":
@@ -198,5 +755,22 @@ if __name__ == "__main__":
             ignore_old = True
         elif arg.isdigit():
             max_steps = int(arg)
+        elif not arg.startswith("-"):
+            paths.append(arg)
+
+    if len(paths) < 2 or len(paths) % 2:
+        print("Usage: find_first_divergence.py <our_trace.json> <cemu_trace.json> [<our_trace.json> <cemu_trace.json> ...] [max_steps] [options]")
+        print("\nEach pair of traces is compared in turn, in one process, so a trace")
+        print("that appears in several pairs is only loaded once (see --no-io).")
+        print("\nOptions:")
+        print("  max_steps     - Maximum steps to compare (default: all)")
+        print("  --no-io       - Skip I/O operation comparison")
+        print("  --writes-only - Only compare write operations (CEmu doesn't trace reads)")
+        print("  --ignore-old  - Ignore old_value differences (register model differences)")
+        sys.exit(1)
 
-    compare_traces(ours_path, cemu_path, max_steps, check_io, writes_only, ignore_old)
+    pairs = list(zip(paths[0::2], paths[1::2]))
+    for ours_path, cemu_path in pairs:
+        if len(pairs) > 1:
+            print(f"\n##### {ours_path} vs {cemu_path} #####")
+        compare_traces(ours_path, cemu_path, max_steps, check_io, writes_only, ignore_old)
@@ -0,0 +1,16 @@
+#!/bin/bash
+# Run find_first_divergence.py under PyPy, whose JIT compiles the step-by-step
+# comparison loop. msgspec/orjson aren't available there; the script falls
+# back to ijson or the stdlib json module on its own.
+# Usage: ./scripts/run_pypy.sh <our_trace.json> <cemu_trace.json> [max_steps] [options]
+
+set -e
+
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+
+if ! command -v pypy3 > /dev/null; then
+    echo "pypy3 not found, running with python3" >&2
+    exec python3 "$SCRIPT_DIR/find_first_divergence.py" "$@"
+fi
+
+exec pypy3 "$SCRIPT_DIR/find_first_divergence.py" "$@"